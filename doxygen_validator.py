@@ -3,30 +3,239 @@ Doxygen Documentation Validator and Fixer
 Uses TAMU AI Chat to validate and fix Doxygen documentation in C++ header files
 """
 
+import hashlib
+import json
+import os
 import re
-from typing import List, Dict, Tuple
-from llm_client import LLMClient
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, replace
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Callable, List, Dict, Optional, Tuple
+from llm_client import LLMClient, positive_int_env
 
+# Building the language (and a parser for it) also fails when the grammar's ABI does
+# not match the installed tree-sitter; the heuristic parser is used in that case too
+try:
+    import tree_sitter_cpp
+    from tree_sitter import Language, Parser
+    _CPP_LANGUAGE = Language(tree_sitter_cpp.language())
+    Parser(_CPP_LANGUAGE)
+    TREE_SITTER_AVAILABLE = True
+except (ImportError, TypeError, ValueError):
+    TREE_SITTER_AVAILABLE = False
 
-class DoxygenValidator:
-    """Validates and fixes Doxygen documentation in C++ header files"""
-    
-    def __init__(self, reference_file_path: str = "angle_set.h"):
-        self.llm_client = LLMClient()
-        self.guidelines = self._load_guidelines()
-        self.reference_example = self._load_reference_example(reference_file_path)
-    
-    def _load_reference_example(self, file_path: str) -> str:
-        """Load reference example file (angle_set.h)"""
-        try:
-            with open(file_path, 'r') as f:
-                return f.read()
-        except FileNotFoundError:
-            return "Reference file not found"
-    
-    def _load_guidelines(self) -> str:
-        """Load Doxygen guidelines from OpenSn documentation"""
-        return """
+
+# Upper bound on simultaneous LLM requests across every fix_file call in this process
+# (LLM_MAX_CONCURRENCY overrides; at least 1); _LLM_CALL_SLOTS enforces it
+MAX_CONCURRENT_LLM_CALLS = positive_int_env("LLM_MAX_CONCURRENCY", 8)
+_LLM_CALL_SLOTS = threading.BoundedSemaphore(MAX_CONCURRENT_LLM_CALLS)
+
+# Upper bound on files fixed at once by fix_files (their requests share _LLM_CALL_SLOTS)
+MAX_CONCURRENT_FILES = 4
+
+# Missing-doc entities documented together in one fix_entities request
+MAX_BATCH_ENTITIES = 8
+
+# Sampling settings of a single-entity fix request (a batch gets FIX_MAX_TOKENS per entity);
+# they are part of the LLM cache key, so fix_entity and fix_entities must share them
+FIX_TEMPERATURE = 0.2
+FIX_MAX_TOKENS = 150
+
+# On-disk cache of raw LLM responses, keyed by a hash of the request
+LLM_CACHE_DIR = Path(tempfile.gettempdir()) / "doxygen-llm-cache"
+LLM_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# Number of lines above an entity searched for its documentation block
+DOC_SEARCH_WINDOW = 15
+
+# In-memory reuse of docs generated for near-identical entity declarations
+SIMILAR_DOC_THRESHOLD = 0.92
+SIMILAR_DOC_CACHE_SIZE = 256
+
+# System prompt shared by fix_entity and fix_entities; kept byte-identical for prompt caching
+FIX_SYSTEM_PROMPT = """You write CONCISE Doxygen documentation for OpenSn (radiation transport code) in the style of its angle_set.h header.
+Return ONLY the output the request asks for: no code, no markdown fences, no explanations.
+Use \\param and \\return, never @-style commands. NEVER use \\brief or \\details."""
+
+# Per-entity-type guidance with the relevant guideline bullets and angle_set.h examples
+CLASS_PROMPT = """ENTITY TYPE: Class
+STYLE: /// single-line noun phrase (NOT a verb or complete sentence)
+EXAMPLE: "/// Angles for a given groupset."
+AVOID: "Class that...", "This class..." openings"""
+
+CONSTRUCTOR_PROMPT = """ENTITY TYPE: Constructor
+STYLE: /** */ block, brief with verb in base form, then one \\param per parameter
+EXAMPLE:
+/**
+ * Construct an AngleSet.
+ * \\param id Unique id of the angleset.
+ * \\param num_groups Number of energy groups in the groupset.
+ */"""
+
+METHOD_PROMPT = """ENTITY TYPE: Method
+STYLE: /// verb phrase with verb in BASE FORM (Get, Set, Build, Check), or /** */ with \\param entries if it has parameters
+EXAMPLES: "/// Get the number of angles in the angleset.", "/// Check if the angleset has the given angle index."
+AVOID: "Gets", "Sets", "Builds", "This method...", "Function that..." openings"""
+
+VARIABLE_PROMPT = """ENTITY TYPE: Member Variable
+STYLE: /// noun phrase describing PURPOSE or MEANING, not just the name
+EXAMPLES: "/// Unique ID of the angleset.", "/// Flag indicating if the angleset has completed its sweep."
+AVOID: "Variable that...", "This variable..." openings"""
+
+# Static leading part of every fix request: the rules plus the guidance for
+# all entity types, so only the per-entity tail differs between requests
+FIX_PROMPT_PREFIX = f"""Generate Doxygen documentation for C++ entities following OpenSn guidelines.
+
+FORMAT RULES:
+1. Each comment is a /// or /** */ block
+2. Be EXTREMELY BRIEF: 3-8 words for most descriptions, ending with a period
+3. For /** */ blocks, one \\param per line with NO empty lines between entries
+
+{CLASS_PROMPT}
+
+{CONSTRUCTOR_PROMPT}
+
+{METHOD_PROMPT}
+
+{VARIABLE_PROMPT}"""
+
+# Answer format requested by fix_entities after its list of entities
+BATCH_FIX_INSTRUCTIONS = """Document EVERY entity above. Return ONLY a JSON list with one object per entity, in the order given:
+[{"line": <entity line number>, "comment": "<comment block, lines joined with \\n>"}]"""
+
+# tree-sitter node types handled by the syntax-tree parser
+_TS_CLASS_TYPES = ('class_specifier', 'struct_specifier', 'union_specifier')
+_TS_WRAPPER_DECLARATORS = ('pointer_declarator', 'reference_declarator', 'init_declarator', 'array_declarator')
+
+# Prefix tuples for single-call str.startswith checks
+_DOC_PREFIXES = ('///', '/**', '*')
+_DOC_OPENERS = ('///', '/**')
+_SKIP_PREFIXES = ('#', '//')
+_ALIAS_PREFIXES = ('using ', 'typedef ')
+_CLASS_KEYWORDS = ('class', 'struct')
+_PARAM_RETURN_PREFIXES = ('\\param', '\\return')
+_CODE_KEYWORDS = ('class ', 'struct ', 'void ', 'int ', 'bool ', 'size_t ', 'const ', 'virtual ',
+                  'public:', 'private:', 'protected:', '{')
+
+# Brief-style checks: non-verb openings, and verbs whose third-person form is flagged
+_BAD_BRIEF_STARTS = frozenset({'this', 'the', 'a', 'an', 'method', 'function', 'given'})
+_VERB_INDICATORS = frozenset({
+    'set', 'get', 'return', 'create', 'build', 'check', 'count', 'make', 'find', 'add',
+    'remove', 'update', 'compute', 'calculate', 'initialize', 'clear', 'reset', 'validate',
+    'process',
+})
+
+# Conjunctions and prepositions that keep a Get*/Is* name from fitting _template_doc
+_TEMPLATE_STOP_WORDS = frozenset({
+    'and', 'or', 'as', 'at', 'by', 'for', 'from', 'if', 'in', 'into', 'of', 'on',
+    'per', 'than', 'to', 'via', 'when', 'with', 'without'
+})
+
+# Access specifier lines mapped to their access level
+_ACCESS_LABELS = {'public:': 'public', 'protected:': 'protected', 'private:': 'private'}
+
+# Precompiled patterns used by the parser and validator hot loops
+_RE_CLASS = re.compile(r'(class|struct)\s+(\w+)')
+_RE_CLASS_KEYWORD = re.compile(r'\b(?:class|struct|union)\b')
+_RE_VAR = re.compile(r'\b(const\s+)?(static\s+)?\w+[\*&\s<>]+\w+\s*[;=]')
+_RE_METHOD = re.compile(r'(\w+)\s*\([^)]*\)')
+_RE_PARAMS = re.compile(r'\(([^)]*)\)')
+_RE_TRIVIAL_GET = re.compile(r'return\s+[\*&]?\w+_')
+_RE_TRIVIAL_SET = re.compile(r'\w+_\s*=')
+_RE_AT_STYLE_FULL = re.compile(r'@(param|return|throw|tparam|note|warning|brief)')
+_RE_BRIEF_DETAILS = re.compile(r'\\(brief|details) ')
+_RE_DOC_ISSUE = re.compile(
+    r'(?P<at_style>@(?:param|return|throw|tparam|note|warning|brief))'
+    r'|(?P<brief_details>\\(?:brief|details))'
+)
+_RE_NAME_WORDS = re.compile(r'[A-Z]+s(?![a-z])|[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+')
+_RE_FENCE = re.compile(r'^```\w*\n?|\n?```$')
+_RE_BODY_KEYWORD = re.compile(r'\b(?:return|if|for|while)\b')
+_RE_OPERATOR = re.compile(r'\boperator\b')
+# Return type (or specifier) followed by a name and '(', unlike "member_(value)" initializers
+_RE_SIGNATURE_START = re.compile(r'\S.*?\s[*&]*~?\w+\s*\(')
+
+
+def _brace_delta(stripped: str) -> int:
+    """Return the net brace count of a line, skipping the scans for brace-free lines"""
+    if '{' not in stripped and '}' not in stripped:
+        return 0
+    return stripped.count('{') - stripped.count('}')
+
+
+def _comment_finished(text: str) -> bool:
+    """
+    Tell whether a partial fix_entity response already holds its whole comment:
+    a closing fence follows the comment, or a line of code shows up (_clean_doc
+    drops everything from there on anyway)
+    """
+    seen_comment = False
+    for line in text.split('\n')[:-1]:  # the last line may still be incomplete
+        stripped = line.strip()
+        if stripped.startswith(_DOC_PREFIXES):
+            seen_comment = True
+        elif stripped.startswith('```'):
+            if seen_comment:
+                return True
+        elif stripped.startswith(_CODE_KEYWORDS):
+            return True
+    return False
+
+
+@dataclass
+class Entity:
+    """C++ entity found by the parser that may need documentation"""
+    __slots__ = ('type', 'line', 'content', 'access', 'name', 'class_name',
+                 'is_constructor', 'is_definition')
+    type: str                  # 'class', 'method' or 'member_variable'
+    line: int                  # 1-based line number
+    content: str               # Source line as written
+    access: str                # 'public', 'protected' or 'private'
+    name: Optional[str]        # Class or method name (None for member variables)
+    class_name: Optional[str]  # Enclosing class (None for classes)
+    is_constructor: bool
+    is_definition: bool
+
+
+def _template_doc(entity: Entity) -> Optional[str]:
+    """
+    Build the doc of a parameterless Get*/Is* method from its name alone, or return None
+    These follow the guideline pattern mechanically, so they need no LLM call
+    """
+    if entity.type != 'method' or entity.is_constructor or not entity.name:
+        return None
+    params = _RE_PARAMS.search(entity.content)
+    if params is None or params.group(1).strip() not in ('', 'void'):
+        return None
+    words = _RE_NAME_WORDS.findall(entity.name)
+    if len(words) < 2 or ''.join(words) != entity.name:
+        return None  # Single word, or a name with underscores
+    # Single letters (IsA, Get2DMesh) and digits (Is1D) have no reliable reading
+    if any(word.isdigit() or (len(word) == 1 and word.isupper()) for word in words[1:]):
+        return None
+    # Keep acronyms and their plurals (ID, XS, IDs) as written, lowercase everything else
+    phrase = [word if word.isupper() or (len(word) > 2 and word[:-1].isupper()) else word.lower()
+              for word in words[1:]]
+    # Names joining clauses (GetOrCreateCache, GetFromIndex), a bare count (GetNum) or a
+    # nested predicate (GetIsDone, GetHasData) do not read as "Get the <noun>"; leave
+    # those to the LLM
+    if _TEMPLATE_STOP_WORDS.intersection(phrase) or phrase == ['num'] or phrase[0] in ('is', 'has'):
+        return None
+    if phrase[0] == 'num':
+        phrase[0] = 'number of'
+    if words[0] == 'Get':
+        return f"/// Get the {' '.join(phrase)}."
+    if words[0] == 'Is':
+        return f"/// Check if {' '.join(phrase)}."
+    return None
+
+
+# Doxygen guidelines text, shared by every validator instance
+GUIDELINES = """
 OpenSn Doxygen Guidelines (https://open-sn.github.io/opensn/devguide/doxygen.html):
 
 PURPOSE:
@@ -132,6 +341,83 @@ MACRO-DEPENDENT IMPLEMENTATION:
 - If API only exists under macro: "Only available when `MACRO_NAME` is defined"
 - If macro not defined for Doxygen: add || defined(DOXYGEN_SHOULD_SKIP_THIS)
 """
+
+
+# Validator copy held by each validation worker process (set once by the pool initializer)
+_worker_validator = None
+
+
+def _init_validation_worker(validator: 'DoxygenValidator') -> None:
+    global _worker_validator
+    _worker_validator = validator
+
+
+def validate_in_worker(content: str) -> Dict:
+    """Validate content with the copy held by a validation_pool() worker"""
+    return _worker_validator.validate_file(content)
+
+
+class DoxygenValidator:
+    """Validates and fixes Doxygen documentation in C++ header files"""
+    
+    def __init__(self, reference_file_path: str = "angle_set.h"):
+        # reference_file_path is accepted for existing callers only: the fix prompts carry
+        # their angle_set.h examples inline (CLASS_PROMPT etc.), so no file is read
+        self.llm_client = LLMClient()
+        self.guidelines = GUIDELINES
+        # (entity type, class, name, stripped content, context, doc, name pattern), newest last
+        self._similar_docs = []
+        self._similar_docs_lock = threading.Lock()
+    
+    def __getstate__(self) -> Dict:
+        """Drop the LLM client and lock when pickled, so validation can run in worker processes"""
+        state = self.__dict__.copy()
+        state['llm_client'] = None
+        state['_similar_docs_lock'] = None
+        return state
+    
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._similar_docs_lock = threading.Lock()
+    
+    def validate_files(self, paths: List[str], max_workers: Optional[int] = None) -> Dict[str, Dict]:
+        """
+        Validate several header files in parallel worker processes
+        Returns dict mapping each path to its validate_file result
+        """
+        contents = []
+        for path in paths:
+            with open(path, 'r') as f:
+                contents.append(f.read())
+        
+        if len(contents) <= 1:
+            return {path: self.validate_file(content) for path, content in zip(paths, contents)}
+        
+        with self.validation_pool(max_workers) as executor:
+            results = list(executor.map(validate_in_worker, contents))
+        return dict(zip(paths, results))
+    
+    def validation_pool(self, max_workers: Optional[int] = None, mp_context=None) -> ProcessPoolExecutor:
+        """
+        Create worker processes for validate_in_worker, each holding one pickled copy of
+        this validator (so the validator is not re-pickled with every submitted file)
+        mp_context is passed to ProcessPoolExecutor (pass a spawn context from threaded servers)
+        """
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context,
+                                   initializer=_init_validation_worker, initargs=(self,))
+    
+    def fix_files(self, file_contents: Dict[str, str], validation_results: Dict[str, Dict]) -> Dict[str, str]:
+        """
+        Fix several files concurrently (LLM-bound, so threads are used)
+        Returns dict mapping each path to its fixed content
+        """
+        paths = list(file_contents)
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_FILES) as executor:
+            fixed = list(executor.map(
+                lambda path: self.fix_file(file_contents[path], validation_results[path]),
+                paths
+            ))
+        return dict(zip(paths, fixed))
     
     def validate_file(self, file_content: str) -> Dict:
         """
@@ -141,13 +427,18 @@ MACRO-DEPENDENT IMPLEMENTATION:
         lines = file_content.split('\n')
         issues = []
         
-        # Parse file structure
-        entities = self._parse_entities(file_content)
+        # Parse file structure (reuse the already-split lines)
+        entities = self._parse_entities(file_content, lines)
+        
+        # Locate every documentation block in one forward pass
+        doc_blocks = self._index_doc_blocks(lines)
         
         # Filter out entities that are already properly documented
         entities_needing_validation = []
         for entity in entities:
-            entity_issues = self._validate_entity(entity, lines)
+            if self._is_clean(entity, lines, doc_blocks):
+                continue
+            entity_issues = self._validate_entity(entity, lines, doc_blocks)
             if entity_issues:
                 issues.extend(entity_issues)
                 entities_needing_validation.append(entity)
@@ -155,14 +446,190 @@ MACRO-DEPENDENT IMPLEMENTATION:
         return {
             'total_entities': len(entities),
             'issues_found': len(issues),
+            'compliance_pct': (len(entities) - len(issues)) / max(len(entities), 1) * 100,
             'issues': issues,
             'entities': entities_needing_validation  # Only entities with issues
         }
     
-    def _parse_entities(self, content: str) -> List[Dict]:
-        """Parse C++ entities that need documentation"""
+    def _index_doc_blocks(self, lines: List[str]) -> List[Optional[Tuple[int, int]]]:
+        """
+        Map each line index to the (start, end) indices of the doc block directly above it
+        Blank lines between the block and the line are skipped; None means no block
+        """
+        doc_blocks = [None] * len(lines)
+        block = None
+        run_start = -1
+        
+        for i, line in enumerate(lines):
+            doc_blocks[i] = block
+            stripped = line.strip()
+            if not stripped:
+                # A blank line ends the current run but stays transparent below it
+                run_start = -1
+            # Doc lines start with '*' or '/'; most code lines fail on the first character
+            elif stripped[0] == '*' or (stripped[0] == '/' and stripped.startswith(_DOC_OPENERS)):
+                if run_start == -1:
+                    run_start = i
+                block = (run_start, i)
+            else:
+                run_start = -1
+                block = None
+        
+        return doc_blocks
+    
+    def _doc_block_for(self, doc_blocks: List[Optional[Tuple[int, int]]], line_idx: int) -> Optional[Tuple[int, int]]:
+        """Return the doc block above a line, clipped to the search window"""
+        block = doc_blocks[line_idx]
+        if block is None:
+            return None
+        lowest = max(1, line_idx - DOC_SEARCH_WINDOW + 1)
+        if block[1] < lowest:
+            return None
+        return max(block[0], lowest), block[1]
+    
+    def _parse_entities(self, content: str, lines: List[str]) -> List[Entity]:
+        """
+        Parse C++ entities that need documentation
+        lines must be content.split('\\n'); the raw content is only needed by tree-sitter
+        """
+        # Every entity lives in a class/struct/union body, so one scan of the
+        # buffer rules out files (sources, free-function headers) with none
+        if not _RE_CLASS_KEYWORD.search(content):
+            return []
+        if TREE_SITTER_AVAILABLE:
+            return self._parse_entities_tree_sitter(content, lines)
+        return self._parse_entities_heuristic(lines)
+    
+    def _parse_entities_tree_sitter(self, content: str, lines: List[str]) -> List[Entity]:
+        """Parse C++ entities by walking a tree-sitter syntax tree"""
+        tree = Parser(_CPP_LANGUAGE).parse(content.encode('utf-8'))
+        entities = []
+        self._ts_collect(tree.root_node, lines, entities)
+        return entities
+    
+    def _ts_collect(self, node, lines: List[str], entities: List[Entity]) -> None:
+        """Find class/struct/union definitions below a node (outside function bodies)"""
+        for child in node.children:
+            if child.type in _TS_CLASS_TYPES and child.child_by_field_name('body') is not None:
+                self._ts_add_class(child, child, lines, entities)
+            elif child.type == 'template_declaration':
+                inner = self._ts_template_inner(child)
+                if inner is not None and inner.type in _TS_CLASS_TYPES and inner.child_by_field_name('body') is not None:
+                    # Documentation goes above the template line
+                    self._ts_add_class(inner, child, lines, entities)
+            elif child.type not in ('function_definition', 'compound_statement'):
+                self._ts_collect(child, lines, entities)
+    
+    def _ts_template_inner(self, node):
+        """Return the declaration wrapped by a template_declaration"""
+        for child in node.children:
+            if child.type not in ('template', 'template_parameter_list', 'comment'):
+                return child
+        return None
+    
+    def _ts_add_class(self, node, anchor, lines: List[str], entities: List[Entity]) -> None:
+        """Add a class entity and its members"""
+        name_node = node.child_by_field_name('name')
+        if name_node is None:
+            return
+        class_name = name_node.text.decode('utf-8')
+        row = anchor.start_point[0]
+        entities.append(Entity(
+            type='class', line=row + 1, content=lines[row], access='public',
+            name=class_name, class_name=None,
+            is_constructor=False, is_definition=False
+        ))
+        
+        access_level = 'private' if node.type == 'class_specifier' else 'public'
+        for member in node.child_by_field_name('body').children:
+            if member.type == 'access_specifier':
+                access_level = member.text.decode('utf-8')
+                continue
+            anchor = member
+            if member.type == 'template_declaration':
+                member = self._ts_template_inner(member)
+                if member is None:
+                    continue
+            
+            if member.type in _TS_CLASS_TYPES and member.child_by_field_name('body') is not None:
+                self._ts_add_class(member, anchor, lines, entities)
+            elif member.type in ('field_declaration', 'declaration', 'function_definition'):
+                nested = member.child_by_field_name('type')
+                if nested is not None and nested.type in _TS_CLASS_TYPES and nested.child_by_field_name('body') is not None:
+                    self._ts_add_class(nested, anchor, lines, entities)
+                    continue
+                self._ts_add_member(member, anchor, class_name, access_level, lines, entities)
+    
+    def _ts_add_member(self, node, anchor, class_name: str, access_level: str,
+                       lines: List[str], entities: List[Entity]) -> None:
+        """Add a member variable or method entity for a declaration inside a class body"""
+        row = anchor.start_point[0]
+        declarator = node.child_by_field_name('declarator')
+        if declarator is None:
+            return  # Nested enum or other declarator-less declaration
+        while declarator.type in _TS_WRAPPER_DECLARATORS:
+            inner = declarator.child_by_field_name('declarator')
+            if inner is None:
+                inner = next((c for c in declarator.named_children if c.type != 'type_qualifier'), None)
+            if inner is None:
+                return
+            declarator = inner
+        
+        if declarator.type != 'function_declarator':
+            if node.type == 'field_declaration':
+                entities.append(Entity(
+                    type='member_variable', line=row + 1, content=lines[row], access=access_level,
+                    name=None, class_name=class_name,
+                    is_constructor=False, is_definition=False
+                ))
+            return
+        
+        name_node = declarator.child_by_field_name('declarator')
+        if name_node is None:
+            return
+        method_name = name_node.text.decode('utf-8')
+        is_destructor = name_node.type == 'destructor_name'
+        is_constructor = method_name == class_name
+        
+        # Declarations without a return type are only constructors/destructors (not macro calls)
+        if node.child_by_field_name('type') is None and not (is_constructor or is_destructor):
+            return
+        
+        # Skip destructors and operator overloads (copy/move assignments included), which
+        # the guidelines do not require, and every defaulted/deleted member
+        if is_destructor or name_node.type == 'operator_name':
+            return
+        if any(c.type in ('default_method_clause', 'delete_method_clause') for c in node.children):
+            return
+        # Skip default constructors and copy/move constructors
+        if is_constructor:
+            params = declarator.child_by_field_name('parameters')
+            param_text = ''.join(params.text.decode('utf-8').split()) if params is not None else '()'
+            if param_text == '()':
+                return
+            if (f'const{class_name}&' in param_text or f'{class_name}const&' in param_text
+                    or f'{class_name}&&' in param_text):
+                return
+        
+        # Skip single-line trivial getters/setters defined in the class body
+        if node.type == 'function_definition' and node.start_point[0] == node.end_point[0]:
+            text = node.text.decode('utf-8')
+            if _RE_TRIVIAL_GET.search(text) or _RE_TRIVIAL_SET.search(text):
+                return
+        
+        # Like the heuristic parser, an in-class body makes a definition unless the method
+        # is virtual or a constructor (their in-class body is the documented declaration)
+        is_definition = (node.type == 'function_definition' and not is_constructor
+                         and not any(c.type == 'virtual' for c in node.children))
+        entities.append(Entity(
+            type='method', line=row + 1, content=lines[row], access=access_level,
+            name=method_name, class_name=class_name,
+            is_constructor=is_constructor, is_definition=is_definition
+        ))
+    
+    def _parse_entities_heuristic(self, lines: List[str]) -> List[Entity]:
+        """Parse C++ entities line by line (fallback when tree-sitter is not installed)"""
         entities = []
-        lines = content.split('\n')
         
         in_class = False
         class_name = None
@@ -171,12 +638,14 @@ MACRO-DEPENDENT IMPLEMENTATION:
         in_function_body = False
         function_brace_depth = 0
         prev_was_method_decl = False  # Track if previous line was a method declaration
+        # Copy/move constructor parameter signatures, built once per class
+        copy_sig = const_copy_sig = move_sig = None
         
         for i, line in enumerate(lines):
             stripped = line.strip()
             
             # Skip empty lines, preprocessor directives, comments, and license headers
-            if not stripped or stripped.startswith('#') or stripped.startswith('//'):
+            if not stripped or stripped.startswith(_SKIP_PREFIXES):
                 continue
             
             # Skip namespace declarations
@@ -184,31 +653,35 @@ MACRO-DEPENDENT IMPLEMENTATION:
                 continue
             
             # Skip type aliases (using/typedef) - per guidelines
-            if stripped.startswith('using ') or stripped.startswith('typedef '):
+            if stripped.startswith(_ALIAS_PREFIXES):
                 continue
             
-            # Track class/struct scope
-            if re.match(r'(class|struct)\s+\w+', stripped) and not stripped.endswith(';'):
-                match = re.search(r'(class|struct)\s+(\w+)', stripped)
-                if match:
-                    in_class = True
-                    class_name = match.group(2)
-                    class_brace_count = 0
-                    access_level = 'private'  # Reset access level for new class
-                    entities.append({
-                        'type': 'class',
-                        'name': class_name,
-                        'line': i + 1,
-                        'content': line,
-                        'access': 'public'
-                    })
-                    # Count braces on the class declaration line
-                    class_brace_count += stripped.count('{') - stripped.count('}')
-                    continue
+            brace_delta = _brace_delta(stripped)
+            
+            # Track class/struct scope (single anchored match captures the name);
+            # the prefix test keeps the regex off lines that cannot match
+            class_match = _RE_CLASS.match(stripped) if stripped.startswith(_CLASS_KEYWORDS) else None
+            if class_match and not stripped.endswith(';'):
+                in_class = True
+                class_name = class_match.group(2)
+                copy_sig = f'const {class_name}&'
+                const_copy_sig = f'{class_name} const&'
+                move_sig = f'{class_name}&&'
+                class_brace_count = 0
+                # Class members default to private, struct members to public
+                access_level = 'private' if class_match.group(1) == 'class' else 'public'
+                entities.append(Entity(
+                    type='class', line=i + 1, content=line, access='public',
+                    name=class_name, class_name=None,
+                    is_constructor=False, is_definition=False
+                ))
+                # Count braces on the class declaration line
+                class_brace_count += brace_delta
+                continue
             
             # Track braces for class scope
             if in_class:
-                class_brace_count += stripped.count('{') - stripped.count('}')
+                class_brace_count += brace_delta
                 
                 # Exit class when braces balance
                 if class_brace_count <= 0:
@@ -222,13 +695,14 @@ MACRO-DEPENDENT IMPLEMENTATION:
                 continue
             
             # Track access level
-            if stripped in ['public:', 'protected:', 'private:']:
-                access_level = stripped.rstrip(':')
+            label = _ACCESS_LABELS.get(stripped)
+            if label is not None:
+                access_level = label
                 continue
             
             # Track function body scope (to skip documentation inside functions)
             if in_function_body:
-                function_brace_depth += stripped.count('{') - stripped.count('}')
+                function_brace_depth += brace_delta
                 if function_brace_depth <= 0:
                     in_function_body = False
                     function_brace_depth = 0
@@ -246,35 +720,43 @@ MACRO-DEPENDENT IMPLEMENTATION:
             if stripped != '{':
                 prev_was_method_decl = False
             
+            # Cheap character tests decide which of the regexes below can apply
+            has_paren = '(' in stripped
+            has_semi = ';' in stripped
+            
             # Member variables (but not method calls or inside function bodies)
-            if ';' in stripped and '(' not in stripped:
+            if not has_paren and has_semi:
                 # Check if it's a variable declaration
-                if re.search(r'\b(const\s+)?(static\s+)?\w+[\*&\s<>]+\w+\s*[;=]', stripped):
+                if _RE_VAR.search(stripped):
                     # Skip if it's inside a method body or constructor initializer
-                    if not any(x in stripped for x in ['return', 'if', 'for', 'while']):
-                        entities.append({
-                            'type': 'member_variable',
-                            'class': class_name,
-                            'line': i + 1,
-                            'content': line,
-                            'access': access_level
-                        })
+                    if not _RE_BODY_KEYWORD.search(stripped):
+                        entities.append(Entity(
+                            type='member_variable', line=i + 1, content=line, access=access_level,
+                            name=None, class_name=class_name,
+                            is_constructor=False, is_definition=False
+                        ))
             
             # Methods/functions
-            if '(' in stripped and ')' in stripped:
-                # Skip constructor initializer lists
-                if ':' in stripped and '(' in stripped and i > 0:
+            if has_paren and ')' in stripped:
+                # Skip constructor initializer lists (a comment above, such as
+                # "// Setup (see below)", is not a constructor signature)
+                if ':' in stripped and i > 0:
                     prev_line = lines[i-1].strip()
-                    if ')' in prev_line:  # This is an initializer list
-                        continue
+                    if ')' in prev_line and not prev_line.startswith(_SKIP_PREFIXES + _DOC_PREFIXES):
+                        continue  # This is an initializer list
                 
-                # Check if it's a method declaration/definition
-                is_declaration = ';' in stripped or 'virtual' in stripped or '= 0' in stripped
-                is_definition = '{' in stripped and not ';' in stripped
+                # Check if it's a method declaration/definition; a body may also open
+                # on the line after the signature
+                has_open_brace = '{' in stripped
+                is_declaration = has_semi or 'virtual' in stripped or '= 0' in stripped
+                is_definition = not has_semi and (has_open_brace or (
+                    not is_declaration and _RE_SIGNATURE_START.match(stripped) is not None
+                    and i + 1 < len(lines) and lines[i + 1].strip().startswith('{')
+                ))
                 
                 if is_declaration or is_definition:
                     # Extract method name and check if it's a constructor/destructor
-                    method_match = re.search(r'(\w+)\s*\([^)]*\)', stripped)
+                    method_match = _RE_METHOD.search(stripped)
                     if method_match:
                         method_name = method_match.group(1)
                         
@@ -288,96 +770,92 @@ MACRO-DEPENDENT IMPLEMENTATION:
                         is_default_ctor = False
                         is_copy_move_ctor = False
                         
-                        if is_constructor:
-                            # Check for = default or = delete
-                            if '= default' in stripped or '= delete' in stripped:
-                                is_default_ctor = True
-                            else:
-                                param_section = re.search(r'\(([^)]*)\)', stripped)
-                                if param_section:
-                                    params = param_section.group(1).strip()
-                                    # Default constructor: no params
-                                    if not params:
-                                        is_default_ctor = True
-                                    # Copy constructor: ClassName(const ClassName&)
-                                    elif f'const {class_name}&' in params or f'{class_name} const&' in params:
-                                        is_copy_move_ctor = True
-                                    # Move constructor: ClassName(ClassName&&)
-                                    elif f'{class_name}&&' in params:
-                                        is_copy_move_ctor = True
+                        # Defaulted/deleted members and operator overloads (copy/move
+                        # assignments included) need no documentation either
+                        is_default_or_operator = ('= default' in stripped or '= delete' in stripped
+                                                  or _RE_OPERATOR.search(stripped) is not None)
+                        
+                        if is_constructor and not is_default_or_operator:
+                            param_section = _RE_PARAMS.search(stripped)
+                            if param_section:
+                                params = param_section.group(1).strip()
+                                # Default constructor: no params
+                                if not params:
+                                    is_default_ctor = True
+                                # Copy constructor: ClassName(const ClassName&)
+                                elif copy_sig in params or const_copy_sig in params:
+                                    is_copy_move_ctor = True
+                                # Move constructor: ClassName(ClassName&&)
+                                elif move_sig in params:
+                                    is_copy_move_ctor = True
                         
                         # Check if it's a trivial getter/setter
                         is_trivial = False
-                        if '{' in stripped and '}' in stripped:
+                        if has_open_brace and '}' in stripped:
                             # Single-line getter: returns member variable
-                            if 'return' in stripped and re.search(r'return\s+[\*&]?\w+_', stripped):
+                            if 'return' in stripped and _RE_TRIVIAL_GET.search(stripped):
                                 is_trivial = True
                             # Single-line setter: assigns to member variable
-                            elif '=' in stripped and re.search(r'\w+_\s*=', stripped):
+                            elif '=' in stripped and _RE_TRIVIAL_SET.search(stripped):
                                 is_trivial = True
                         
                         # Track function body BEFORE filtering (so we skip content inside ALL functions)
                         if is_definition and not is_declaration:
                             in_function_body = True
-                            function_brace_depth = stripped.count('{') - stripped.count('}')
+                            function_brace_depth = brace_delta
                         
                         # If this is a declaration without {, mark that next { might be function body
-                        if is_declaration and not is_definition and not ';' in stripped:
+                        if is_declaration and not is_definition and not has_semi:
                             prev_was_method_decl = True
                         
-                        # Only add if not a default constructor, copy/move constructor, destructor, or trivial getter/setter
-                        if not is_default_ctor and not is_copy_move_ctor and not is_destructor and not is_trivial:
-                            entities.append({
-                                'type': 'method',
-                                'class': class_name,
-                                'name': method_name,
-                                'line': i + 1,
-                                'content': line,
-                                'access': access_level,
-                                'is_constructor': is_constructor,
-                                'is_definition': is_definition and not is_declaration
-                            })        
+                        # Only add if not a default constructor, copy/move constructor, destructor,
+                        # defaulted/deleted member, operator overload, or trivial getter/setter
+                        # (a constructor's in-class body is its declaration, never a definition)
+                        if (not is_default_ctor and not is_copy_move_ctor and not is_destructor
+                                and not is_default_or_operator and not is_trivial):
+                            entities.append(Entity(
+                                type='method', line=i + 1, content=line, access=access_level,
+                                name=method_name, class_name=class_name,
+                                is_constructor=is_constructor,
+                                is_definition=is_definition and not is_declaration and not is_constructor
+                            ))
         return entities
     
-    def _validate_entity(self, entity: Dict, lines: List[str]) -> List[Dict]:
+    def _is_clean(self, entity: Entity, lines: List[str],
+                  doc_blocks: List[Optional[Tuple[int, int]]]) -> bool:
+        """
+        Fast check for a documented class or member variable that cannot have issues
+        Their style checks only look for @-commands and backslash commands in the doc block
+        """
+        if entity.type not in ('class', 'member_variable'):
+            return False
+        block = self._doc_block_for(doc_blocks, entity.line - 1)
+        if block is None:
+            return False
+        for i in range(block[0], block[1] + 1):
+            if '@' in lines[i] or '\\' in lines[i]:
+                return False
+        return True
+    
+    def _validate_entity(self, entity: Entity, lines: List[str],
+                         doc_blocks: List[Optional[Tuple[int, int]]]) -> List[Dict]:
         """Validate a single entity for Doxygen compliance"""
         issues = []
-        line_idx = entity['line'] - 1
+        line_idx = entity.line - 1
         
         # Check for documentation above the entity
-        has_doc = False
-        doc_lines = []
-        doc_start_line = -1
-        
-        # Look backwards for documentation (up to 15 lines)
-        for i in range(line_idx - 1, max(0, line_idx - 15), -1):
-            line = lines[i].strip()
-            
-            # Found Doxygen comment
-            if line.startswith('///') or line.startswith('/**') or (line.startswith('*') and not line.startswith('*/')):
-                has_doc = True
-                doc_lines.insert(0, line)
-                doc_start_line = i
-            elif line.startswith('*/'):
-                has_doc = True
-                doc_lines.insert(0, line)
-            # Empty line
-            elif not line:
-                if has_doc:
-                    break
-                continue
-            # Hit code before finding doc
-            else:
-                break
+        block = self._doc_block_for(doc_blocks, line_idx)
+        has_doc = block is not None
+        doc_lines = [lines[i].strip() for i in range(block[0], block[1] + 1)] if has_doc else []
         
         # Determine if this entity needs documentation
         needs_doc = False
         
-        if entity['type'] == 'class':
+        if entity.type == 'class':
             needs_doc = True
-        elif entity['type'] == 'method':
+        elif entity.type == 'method':
             # Skip if this is a function definition (documentation should be at declaration only)
-            if entity.get('is_definition', False):
+            if entity.is_definition:
                 # Flag as error if documentation is present at definition
                 if has_doc:
                     issues.append({
@@ -389,9 +867,9 @@ MACRO-DEPENDENT IMPLEMENTATION:
                 return issues
             
             # Public methods need documentation (already filtered out trivial getters/setters and destructors in parser)
-            if entity.get('access') == 'public':
+            if entity.access == 'public':
                 needs_doc = True
-        elif entity['type'] == 'member_variable':
+        elif entity.type == 'member_variable':
             needs_doc = True
         
         # Flag missing documentation
@@ -400,16 +878,23 @@ MACRO-DEPENDENT IMPLEMENTATION:
                 'entity': entity,
                 'issue_type': 'missing_documentation',
                 'severity': 'error',
-                'message': f"Missing Doxygen documentation for {entity['type']}"
+                'message': f"Missing Doxygen documentation for {entity.type}"
             })
             return issues
         
         # If documentation EXISTS, validate its style
         if has_doc:
-            doc_text = ' '.join(doc_lines)
+            # One scan reports both @-style commands and \\brief/\\details;
+            # no command spans lines, so the block is scanned line by line
+            found = set()
+            for doc_line in doc_lines:
+                for match in _RE_DOC_ISSUE.finditer(doc_line):
+                    found.add(match.lastgroup)
+                if len(found) == 2:
+                    break
             
             # Check for @-style commands (should use backslash)
-            if re.search(r'@(param|return|throw|tparam|note|warning|brief)', doc_text):
+            if 'at_style' in found:
                 issues.append({
                     'entity': entity,
                     'issue_type': 'wrong_style',
@@ -418,7 +903,7 @@ MACRO-DEPENDENT IMPLEMENTATION:
                 })
             
             # Check for \\brief or \\details (should not be used)
-            if '\\brief' in doc_text or '\\details' in doc_text:
+            if 'brief_details' in found:
                 issues.append({
                     'entity': entity,
                     'issue_type': 'wrong_command',
@@ -428,7 +913,7 @@ MACRO-DEPENDENT IMPLEMENTATION:
             
             # Check if using proper comment style (/// or /** */)
             first_doc_line = doc_lines[0] if doc_lines else ''
-            if first_doc_line and not (first_doc_line.startswith('///') or first_doc_line.startswith('/**') or first_doc_line.startswith('*')):
+            if first_doc_line and not first_doc_line.startswith(_DOC_PREFIXES):
                 issues.append({
                     'entity': entity,
                     'issue_type': 'wrong_format',
@@ -437,7 +922,7 @@ MACRO-DEPENDENT IMPLEMENTATION:
                 })
             
             # Validate method documentation starts with verb in base form
-            if entity['type'] == 'method' and not entity.get('is_constructor', False):
+            if entity.type == 'method' and not entity.is_constructor:
                 # Extract the brief description (first sentence or first line after ///)
                 brief = ''
                 for line in doc_lines:
@@ -449,18 +934,18 @@ MACRO-DEPENDENT IMPLEMENTATION:
                         break
                     elif line.startswith('*') and not line.startswith('*/'):
                         text = line.replace('*', '').strip()
-                        if text and not text.startswith('\\param') and not text.startswith('\\return'):
+                        if text and not text.startswith(_PARAM_RETURN_PREFIXES):
                             brief = text
                             break
                 
                 # Check if brief starts with a verb in base form
                 if brief:
-                    first_word = brief.split()[0] if brief.split() else ''
+                    words = brief.split()
+                    first_word = words[0] if words else ''
                     first_word_lower = first_word.lower()
                     
                     # Check if it starts with common non-verb patterns
-                    bad_patterns = ['this', 'the', 'a', 'an', 'method', 'function', 'given']
-                    if first_word_lower in bad_patterns:
+                    if first_word_lower in _BAD_BRIEF_STARTS:
                         issues.append({
                             'entity': entity,
                             'issue_type': 'wrong_brief_style',
@@ -472,9 +957,6 @@ MACRO-DEPENDENT IMPLEMENTATION:
                     elif first_word_lower.endswith('s') and len(first_word) > 2:
                         # Check if it's likely a verb in wrong form (not a noun like "class")
                         # Common verb patterns: Sets, Gets, Returns, Creates, Builds, Checks, Counts, etc.
-                        verb_indicators = ['set', 'get', 'return', 'create', 'build', 'check', 'count', 
-                                         'make', 'find', 'add', 'remove', 'update', 'compute', 'calculate',
-                                         'initialize', 'clear', 'reset', 'validate', 'process']
                         base_form = first_word_lower.rstrip('s')
                         # Handle 'es' ending (e.g., "Creates" → "Create")
                         if base_form.endswith('e'):
@@ -484,7 +966,7 @@ MACRO-DEPENDENT IMPLEMENTATION:
                             if not suggested_form:
                                 suggested_form = first_word.rstrip('s').capitalize()
                         
-                        if base_form.rstrip('e') in verb_indicators or base_form in verb_indicators:
+                        if base_form.rstrip('e') in _VERB_INDICATORS or base_form in _VERB_INDICATORS:
                             issues.append({
                                 'entity': entity,
                                 'issue_type': 'wrong_brief_style',
@@ -493,8 +975,8 @@ MACRO-DEPENDENT IMPLEMENTATION:
                             })
             
             # Check for empty lines between \param entries (should be compact)
-            if '\\param' in doc_text:
-                param_lines = [i for i, line in enumerate(doc_lines) if '\\param' in line]
+            param_lines = [i for i, line in enumerate(doc_lines) if '\\param' in line]
+            if param_lines:
                 for i in range(len(param_lines) - 1):
                     if param_lines[i+1] - param_lines[i] > 1:
                         # Check if there's an empty line between params
@@ -510,237 +992,321 @@ MACRO-DEPENDENT IMPLEMENTATION:
         
         return issues
     
-    def _validate_documentation(self, doc_text: str, entity: Dict) -> List[Dict]:
-        """Validate documentation quality"""
-        issues = []
-        
-        # Check for \\brief or \\details (should not be used)
-        if '\\brief' in doc_text or '\\details' in doc_text:
-            issues.append({
-                'entity': entity,
-                'issue_type': 'wrong_command',
-                'severity': 'error',
-                'message': 'Do not use \\brief or \\details (JAVADOC_AUTOBRIEF=ON)'
-            })
+    def fix_entity(self, entity: Entity, context_lines: List[str]) -> str:
+        """Generate proper Doxygen documentation for an entity using LLM"""
+        doc = _template_doc(entity)
+        if doc is not None:
+            return doc
+        messages = self._entity_messages(entity, context_lines)
+        context = self._entity_context(entity, context_lines)
+        try:
+            doc = self._clean_doc(self._cached_llm_call(
+                messages, temperature=FIX_TEMPERATURE, max_tokens=FIX_MAX_TOKENS,
+                entity=entity, context=context, stop_when=_comment_finished
+            ))
+            self._remember_doc(entity, context, doc)
+            return doc
+        except Exception as e:
+            return f"/// TODO: Add documentation (error: {e})"
+    
+    def fix_entities(self, entities: List[Entity], context_lines: List[str],
+                     progress: Optional[Callable[[int, int], None]] = None) -> List[str]:
+        """
+        Generate documentation for several entities of one file, in entity order
+        Entities without a template, cached or similar doc are sent MAX_BATCH_ENTITIES per request;
+        progress(done, total) is called from the calling thread as docs become available
+        """
+        docs = [None] * len(entities)
+        pending = []
+        for i, entity in enumerate(entities):
+            docs[i] = _template_doc(entity)
+            if docs[i] is not None:
+                continue
+            messages = self._entity_messages(entity, context_lines)
+            context = self._entity_context(entity, context_lines)
+            doc = self._read_llm_cache(self._llm_cache_path(messages, FIX_TEMPERATURE, FIX_MAX_TOKENS))
+            if doc is None:
+                doc = self._find_similar_doc(entity, context)
+            if doc is None:
+                pending.append(i)
+                continue
+            docs[i] = self._clean_doc(doc)
+            self._remember_doc(entity, context, docs[i])
         
-        # Check for @ commands (should use backslash)
-        if re.search(r'@(param|return|throw|tparam)', doc_text):
-            issues.append({
-                'entity': entity,
-                'issue_type': 'wrong_style',
-                'severity': 'error',
-                'message': 'Use backslash-style commands (\\param) not @-style'
-            })
+        done = len(entities) - len(pending)
+        if progress is not None and entities:
+            progress(done, len(entities))
         
-        return issues
+        batches = [pending[i:i + MAX_BATCH_ENTITIES] for i in range(0, len(pending), MAX_BATCH_ENTITIES)]
+        # Each batch is one blocking LLM round-trip, so overlap them in a bounded pool
+        # and collect them as they finish, so progress reports are not held back
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_LLM_CALLS) as executor:
+            futures = {
+                executor.submit(self._fix_batch, [entities[i] for i in batch], context_lines): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                batch = futures[future]
+                for i, doc in zip(batch, future.result()):
+                    docs[i] = doc
+                done += len(batch)
+                if progress is not None:
+                    progress(done, len(entities))
+        return docs
     
-    def fix_entity(self, entity: Dict, file_content: str) -> str:
-        """Generate proper Doxygen documentation for an entity using LLM"""
+    def _fix_batch(self, entities: List[Entity], context_lines: List[str]) -> List[str]:
+        """Document a batch of entities with one LLM request, per entity where that fails"""
+        sections = []
+        for n, entity in enumerate(entities, 1):
+            context = self._entity_context(entity, context_lines)
+            sections.append(f"""=== ENTITY {n}: {entity.type} at line {entity.line} ===
+Code: {entity.content}
+```cpp
+{context}
+```""")
+        prompt = '\n\n'.join([FIX_PROMPT_PREFIX] + sections + [BATCH_FIX_INSTRUCTIONS])
+        messages = [
+            {"role": "system", "content": FIX_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
         
-        # Prepare context for LLM
-        context_lines = file_content.split('\n')
-        line_idx = entity['line'] - 1
+        comments = {}
+        if len(entities) > 1:
+            try:
+                response = self._llm_call(
+                    messages, temperature=FIX_TEMPERATURE, max_tokens=FIX_MAX_TOKENS * len(entities)
+                )
+                comments = self._parse_batch_response(response)
+            except Exception:
+                pass
         
-        # Get surrounding context (5 lines before and after)
-        start = max(0, line_idx - 5)
-        end = min(len(context_lines), line_idx + 6)
-        context = '\n'.join(context_lines[start:end])
+        docs = []
+        for entity in entities:
+            comment = comments.get(entity.line)
+            if not comment:
+                # Single entity, unusable answer, or entity left out: ask on its own
+                docs.append(self.fix_entity(entity, context_lines))
+                continue
+            # Store under the single-entity key so reruns and fix_entity hit the cache
+            messages = self._entity_messages(entity, context_lines)
+            self._write_llm_cache(self._llm_cache_path(messages, FIX_TEMPERATURE, FIX_MAX_TOKENS), comment)
+            doc = self._clean_doc(comment)
+            self._remember_doc(entity, self._entity_context(entity, context_lines), doc)
+            docs.append(doc)
+        return docs
+    
+    @staticmethod
+    def _parse_batch_response(response: str) -> Dict[int, str]:
+        """Map entity line numbers to comments from a fix_entities JSON answer"""
+        start = response.find('[')
+        end = response.rfind(']')
+        if start == -1 or end < start:
+            return {}
+        try:
+            records = json.loads(response[start:end + 1])
+        except ValueError:
+            return {}
+        comments = {}
+        if isinstance(records, list):
+            for record in records:
+                if isinstance(record, dict) and isinstance(record.get('comment'), str):
+                    try:
+                        comments[int(record.get('line'))] = record['comment']
+                    except (TypeError, ValueError):
+                        continue
+        return comments
+    
+    @staticmethod
+    def _entity_context(entity: Entity, context_lines: List[str]) -> str:
+        """Return the code shown to the LLM around an entity (5 lines before and after)"""
+        line_idx = entity.line - 1
+        return '\n'.join(context_lines[max(0, line_idx - 5):line_idx + 6])
+    
+    def _entity_messages(self, entity: Entity, context_lines: List[str]) -> List[Dict]:
+        """Build the single-entity fix_entity request"""
+        # Prepare context for LLM (slice the caller's current line list)
+        context = self._entity_context(entity, context_lines)
         
         # Determine entity-specific instructions
-        entity_type = entity['type']
-        is_constructor = entity.get('is_constructor', False)
+        entity_type = entity.type
+        is_constructor = entity.is_constructor
         
-        # Build entity-specific guidance
+        # Point at the guidance block for this entity type in the shared prefix
         if entity_type == 'class':
-            entity_guidance = """
-ENTITY TYPE: Class
-STYLE: Use /// for single-line noun phrase
-PATTERN: "/// [Noun phrase describing what this class represents]."
-EXAMPLES FROM angle_set.h:
-  - "/// Angles for a given groupset"
-RULES:
-  - Start with a noun (NOT "Class that..." or "This class...")
-  - 3-6 words maximum
-  - End with period
-  - NO verbs, NO complete sentences
-  - NEVER use \\brief or @brief
-"""
+            entity_guidance = "Follow the ENTITY TYPE: Class guidance."
         elif entity_type == 'method':
             if is_constructor:
-                entity_guidance = """
-ENTITY TYPE: Constructor
-STYLE: Use /** */ multi-line with \\param for each parameter
-PATTERN:
-  /**
-   * [Verb phrase describing what constructor does].
-   * \\param param1 [Brief description].
-   * \\param param2 [Brief description].
-   */
-EXAMPLES FROM angle_set.h:
-  /**
-   * Construct an AngleSet.
-   * \\param id Unique id of the angleset.
-   * \\param num_groups Number of energy groups in the groupset.
-   * \\param spds Associated SPDS.
-   */
-RULES:
-  - Brief: Start with verb in base form (Construct, Initialize, Create, Build)
-  - Each \\param on separate line, NO empty lines between params
-  - Param descriptions: noun phrases, brief (3-6 words)
-  - NO @param, use \\param
-  - NEVER use \\brief or @brief - just write the description directly
-"""
+                entity_guidance = "Follow the ENTITY TYPE: Constructor guidance."
             else:
-                entity_guidance = """
-ENTITY TYPE: Method
-STYLE: Use /// for single-line verb phrase (or /** */ if has parameters)
-PATTERN: "/// [Verb in base form] [object]."
-EXAMPLES FROM angle_set.h:
-  - "/// Get the number of angles in the angleset."
-  - "/// Check if the angleset has the given angle index."
-  - "/// Return the maximum buffer size from the sweepbuffer."
-  - "/// Set the maximum buffer size for the sweepbuffer."
-  - "/// Block the current thread until all send buffers are flushed."
-RULES:
-  - Start with VERB in BASE FORM (Get, Set, Build, Initialize, Check, Return, Add, Remove, Update, etc.)
-  - NOT "Gets", "Sets", "Builds" (no 's' or 'es')
-  - NOT "This method...", "Method to...", "Function that..."
-  - 5-10 words maximum
-  - End with period
-  - If method has parameters, use /** */ with \\param entries
-"""
+                entity_guidance = "Follow the ENTITY TYPE: Method guidance."
         elif entity_type == 'member_variable':
-            entity_guidance = """
-ENTITY TYPE: Member Variable
-STYLE: Use /// for single-line noun phrase
-PATTERN: "/// [Noun phrase describing what this variable represents]."
-EXAMPLES FROM angle_set.h:
-  - "/// Unique ID of the angleset."
-  - "/// Associated SPDS."
-  - "/// Associated FLUDS."
-  - "/// Angle indices associated with the angleset."
-  - "/// Sweep boundaries."
-  - "/// Flag indicating if the angleset has completed its sweep."
-RULES:
-  - Start with a noun (NOT "Variable that..." or "This variable...")
-  - Describe PURPOSE or MEANING, not just the name
-  - 3-8 words maximum
-  - End with period
-  - NO verbs, NO complete sentences
-"""
+            entity_guidance = "Follow the ENTITY TYPE: Member Variable guidance."
         else:
             entity_guidance = "Follow angle_set.h style exactly."
         
-        # Build prompt for LLM with reference example
-        prompt = f"""Generate proper Doxygen documentation for this C++ code following OpenSn guidelines.
-
-=== REFERENCE EXAMPLE (angle_set.h) - YOUR STYLE GUIDE ===
-Study these EXACT examples from angle_set.h and match their brevity and style:
-
-```cpp
-{self.reference_example}
-```
-
-{entity_guidance}
+        # Only entity-specific content follows the shared static prefix, so
+        # providers can reuse their cached prefix across every call in a run
+        prompt = f"""{FIX_PROMPT_PREFIX}
 
 === CODE TO DOCUMENT ===
 ```cpp
 {context}
 ```
 
-Entity: {entity['type']} at line {entity['line']}
-Code: {entity['content']}
+Entity: {entity.type} at line {entity.line}
+Code: {entity.content}
 
-IMPORTANT: Document ONLY this specific {entity['type']} on line {entity['line']}.
+IMPORTANT: Document ONLY this specific {entity.type} on line {entity.line}.
 DO NOT generate documentation for other entities.
 Focus ONLY on the entity shown above.
-
-=== CRITICAL FORMATTING RULES ===
-1. Return ONLY the comment block (/// or /** */)
-2. Do NOT include markdown code fences (```cpp or ```)
-3. Do NOT include any explanatory text
-4. Do NOT include the code itself
-5. Do NOT regenerate or repeat the code being documented
-6. For multi-line comments with \\param:
-   - NO empty lines between \\param entries
-   - Each \\param on its own line
-   - Compact format like angle_set.h
-
-=== EXAMPLES OF CORRECT OUTPUT ===
-
-For a class:
-/// Geometry manager for mesh operations.
-
-For a simple method:
-/// Get the spatial dimension.
-
-For a constructor with params:
-/**
- * Construct a GeometryManager.
- * \\param dimension Spatial dimension (1–3).
- * \\param mesh Associated mesh handler.
- */
-
-For a member variable:
-/// Spatial dimension of the domain.
+{entity_guidance}
 
 Return ONLY the comment!"""
 
-        messages = [
-            {
-                "role": "system", 
-                "content": """You are an expert at writing CONCISE Doxygen documentation for OpenSn (radiation transport code). 
-
-CRITICAL RULES:
-1. Classes: Noun phrases ONLY (e.g., "Geometry manager for meshes")
-2. Methods: Start with VERB in BASE FORM (Get, Set, Build, Initialize, Check, Return, Add, Remove, Update)
-   - NEVER "Gets", "Sets", "Builds" (no 's' or 'es')
-   - NEVER "This method...", "Method to...", "Function that..."
-3. Variables: Noun phrases describing PURPOSE (e.g., "Spatial dimension of the domain")
-4. Constructors: Use /** */ with \\param entries, NO empty lines between params
-5. Be EXTREMELY BRIEF: 3-8 words for most descriptions
-6. Follow angle_set.h style EXACTLY
-7. Return ONLY the comment block, NO code, NO markdown fences, NO explanations
-8. NEVER use \\brief or \\details commands - they are FORBIDDEN
-9. NEVER use @param, @return, @brief - use \\param, \\return instead"""
-            },
+        return [
+            {"role": "system", "content": FIX_SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
         ]
+    
+    @staticmethod
+    def _clean_doc(doc: str) -> str:
+        """Strip markdown fences and any trailing code from an LLM comment"""
+        doc = doc.strip()
+        
+        # Remove markdown code fences if present
+        if '```' in doc:
+            # Remove the opening and closing fences in one pass
+            doc = _RE_FENCE.sub('', doc)
+        
+        # Remove any code that was accidentally included
+        # Stop at first line that looks like code (class, struct, void, int, etc.)
+        lines = doc.split('\n')
+        comment_lines = []
+        for line in lines:
+            stripped = line.strip()
+            # Stop if we hit actual code
+            if stripped and not stripped.startswith(_DOC_PREFIXES):
+                # Check if it's code (starts with keywords)
+                if stripped.startswith(_CODE_KEYWORDS):
+                    break
+            comment_lines.append(line)
+        
+        return '\n'.join(comment_lines).strip()
+    
+    def _cached_llm_call(self, messages: List[Dict], temperature: float, max_tokens: int,
+                         entity: Optional[Entity] = None, context: str = '',
+                         stop_when: Optional[Callable[[str], bool]] = None) -> str:
+        """
+        Call the LLM, reusing a cached response for an identical request
+        On a cache miss, a doc generated for a near-identical entity (with a near-identical
+        context) is reused if available; stop_when is handed to the client to end a
+        streamed response early
+        """
+        cache_path = self._llm_cache_path(messages, temperature, max_tokens)
+        
+        cached = self._read_llm_cache(cache_path)
+        if cached is not None:
+            return cached
         
+        if entity is not None:
+            similar = self._find_similar_doc(entity, context)
+            if similar is not None:
+                return similar
+        
+        response = self._llm_call(messages, temperature=temperature, max_tokens=max_tokens, stop_when=stop_when)
+        self._write_llm_cache(cache_path, response)
+        return response
+    
+    def _llm_call(self, messages: List[Dict], temperature: float, max_tokens: int,
+                  stop_when: Optional[Callable[[str], bool]] = None) -> str:
+        """Send one LLM request once one of the process-wide MAX_CONCURRENT_LLM_CALLS slots is free"""
+        with _LLM_CALL_SLOTS:
+            return self.llm_client._call_with_fallback(
+                messages, temperature=temperature, max_tokens=max_tokens, stop_when=stop_when
+            )
+    
+    @staticmethod
+    def _llm_cache_path(messages: List[Dict], temperature: float, max_tokens: int) -> Path:
+        """Return the cache file for an LLM request"""
+        key = hashlib.sha256(json.dumps(
+            {'messages': messages, 'temperature': temperature, 'max_tokens': max_tokens},
+            sort_keys=True
+        ).encode('utf-8')).hexdigest()
+        return LLM_CACHE_DIR / f"{key}.txt"
+    
+    def _find_similar_doc(self, entity: Entity, context: str) -> Optional[str]:
+        """
+        Return a doc generated for a near-identical declaration, renamed for this entity
+        The declaration must belong to a class of the same name and sit in near-identical
+        surrounding code, so one class's doc is not handed to an unrelated override
+        """
+        name = entity.name
+        if not name:
+            return None
+        content = entity.content.strip()
+        
+        with self._similar_docs_lock:
+            candidates = list(self._similar_docs)
+        
+        for entity_type, class_name, prev_name, prev_content, prev_context, doc, name_pattern in reversed(candidates):
+            if entity_type != entity.type or class_name != entity.class_name:
+                continue
+            # Only reuse a doc that stays accurate after renaming the identifier
+            if prev_name != name and name_pattern is None:
+                continue
+            if not (self._is_similar(prev_content, content) and self._is_similar(prev_context, context)):
+                continue
+            if prev_name == name:
+                return doc
+            return name_pattern.sub(name, doc)
+        return None
+    
+    @staticmethod
+    def _is_similar(previous: str, current: str) -> bool:
+        """Tell whether two snippets reach SIMILAR_DOC_THRESHOLD (cheap upper bound first)"""
+        matcher = SequenceMatcher(None, previous, current)
+        return matcher.quick_ratio() >= SIMILAR_DOC_THRESHOLD and matcher.ratio() >= SIMILAR_DOC_THRESHOLD
+    
+    def _remember_doc(self, entity: Entity, context: str, doc: str) -> None:
+        """Record a generated doc for reuse by near-identical entities"""
+        if not entity.name or not doc:
+            return
+        # Compile the identifier pattern once; None marks docs that never name it
+        name_pattern = re.compile(rf'\b{re.escape(entity.name)}\b')
+        if not name_pattern.search(doc):
+            name_pattern = None
+        with self._similar_docs_lock:
+            self._similar_docs.append((entity.type, entity.class_name, entity.name,
+                                       entity.content.strip(), context, doc, name_pattern))
+            del self._similar_docs[:-SIMILAR_DOC_CACHE_SIZE]
+    
+    def _read_llm_cache(self, cache_path: Path) -> Optional[str]:
+        """Return a cached response if present and younger than the TTL"""
         try:
-            doc = self.llm_client._call_with_fallback(messages, temperature=0.2, max_tokens=500)
-            
-            # Clean up the response
-            doc = doc.strip()
-            
-            # Remove markdown code fences if present
-            if '```' in doc:
-                # Remove opening fence
-                doc = re.sub(r'^```\w*\n?', '', doc)
-                # Remove closing fence
-                doc = re.sub(r'\n?```$', '', doc)
-            
-            # Remove any code that was accidentally included
-            # Stop at first line that looks like code (class, struct, void, int, etc.)
-            lines = doc.split('\n')
-            comment_lines = []
-            for line in lines:
-                stripped = line.strip()
-                # Stop if we hit actual code
-                if stripped and not stripped.startswith('///') and not stripped.startswith('/**') and not stripped.startswith('*'):
-                    # Check if it's code (starts with keywords)
-                    if any(stripped.startswith(kw) for kw in ['class ', 'struct ', 'void ', 'int ', 'bool ', 'size_t ', 'const ', 'virtual ', 'public:', 'private:', 'protected:', '{']):
-                        break
-                comment_lines.append(line)
-            
-            doc = '\n'.join(comment_lines).strip()
-            
-            return doc
-        except Exception as e:
-            return f"/// TODO: Add documentation (error: {e})"
+            if time.time() - cache_path.stat().st_mtime > LLM_CACHE_TTL_SECONDS:
+                return None
+            return cache_path.read_text(encoding='utf-8')
+        except OSError:
+            return None
     
-    def fix_file(self, file_content: str, validation_result: Dict) -> str:
-        """Fix all documentation issues in the file"""
+    def _write_llm_cache(self, cache_path: Path, response: str) -> None:
+        """Store a response in the cache (best effort, never raises)"""
+        try:
+            LLM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            # Write to a private temp file first so concurrent readers never see partial output
+            fd, tmp_path = tempfile.mkstemp(dir=LLM_CACHE_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(response)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+    
+    def fix_file(self, file_content: str, validation_result: Dict,
+                 progress: Optional[Callable[[int, int], None]] = None) -> str:
+        """
+        Fix all documentation issues in the file
+        progress(done, total), if given, reports how many entity docs have been generated
+        """
         lines = file_content.split('\n')
         
         # Separate issues into different categories
@@ -756,7 +1322,7 @@ CRITICAL RULES:
         regenerate_issues = [
             issue for issue in validation_result['issues']
             if issue['issue_type'] in ['wrong_brief_style', 'wrong_command'] or
-               (issue['issue_type'] == 'wrong_style' and issue['entity']['type'] == 'class' and '@brief' in issue.get('message', ''))
+               (issue['issue_type'] == 'wrong_style' and issue['entity'].type == 'class' and '@brief' in issue.get('message', ''))
         ]
         
         # Simple style fixes (can be done with find/replace)
@@ -765,31 +1331,62 @@ CRITICAL RULES:
             if issue['issue_type'] in ['wrong_style', 'wrong_format'] and issue not in regenerate_issues
         ]
         
-        # Fix simple style issues first (don't change line count)
+        # Group style issues by entity so each doc block is located and rewritten once
+        style_issues_by_line = {}
         for issue in style_issues:
-            lines = self._fix_style_issue(lines, issue)
+            style_issues_by_line.setdefault(issue['entity'].line, []).append(issue)
         
-        # Regenerate documentation for issues that can't be fixed with find/replace
-        # Sort by line number in REVERSE order
-        regenerate_issues.sort(key=lambda x: x['entity']['line'], reverse=True)
-        for issue in regenerate_issues:
-            lines = self._regenerate_documentation(lines, issue)
+        # Lines removed so far as (original entity line, count); every removal
+        # lies in the doc block directly above its entity, so it shifts that
+        # entity and everything below it
+        removals = []
         
-        # For missing documentation, we need to be careful about line numbers
-        # Sort by line number in REVERSE order so insertions don't affect later line numbers
-        missing_doc_issues.sort(key=lambda x: x['entity']['line'], reverse=True)
+        # Fix simple style issues first, bottom-up so a removed empty line never
+        # shifts a block that is still to be fixed (the doc index stays valid above)
+        doc_blocks = self._index_doc_blocks(lines)
+        for line in sorted(style_issues_by_line, reverse=True):
+            count = len(lines)
+            lines = self._fix_style_issues(lines, style_issues_by_line[line], doc_blocks)
+            if len(lines) < count:
+                removals.append((line, count - len(lines)))
         
-        for issue in missing_doc_issues:
-            entity = issue['entity']
-            line_idx = entity['line'] - 1
-            
-            # Validate line index
-            if line_idx < 0 or line_idx >= len(lines):
-                continue
-            
-            # Generate documentation using CURRENT state of file
-            current_content = '\n'.join(lines)
-            doc = self.fix_entity(entity, current_content)
+        # Regenerate documentation for issues that can't be fixed with find/replace,
+        # once per entity even if it has several such issues
+        regenerate_entities = []
+        seen = set()
+        for issue in sorted(regenerate_issues, key=lambda x: x['entity'].line):
+            if id(issue['entity']) not in seen:
+                seen.add(id(issue['entity']))
+                regenerate_entities.append(issue['entity'])
+        
+        # Strip every old block top-down, working on copies moved to their current
+        # lines so the caller's validation result keeps its original line numbers
+        stripped_entities = []
+        for original in regenerate_entities:
+            original_line = original.line
+            entity = replace(original, line=self._shifted_line(original_line, removals))
+            count = self._remove_documentation(lines, entity)
+            if count:
+                removals.append((original_line, count))
+                stripped_entities.append(entity)
+        
+        # Move entities missing documentation to their current lines as well,
+        # dropping any whose line index is out of range
+        missing_entities = [
+            replace(issue['entity'], line=self._shifted_line(issue['entity'].line, removals))
+            for issue in missing_doc_issues
+        ]
+        missing_entities = [entity for entity in missing_entities if 0 <= entity.line - 1 < len(lines)]
+        
+        # Generate replacements and missing docs together in batched requests
+        # before any insertion; lines is only read until every request returns
+        entities = stripped_entities + missing_entities
+        docs = self.fix_entities(entities, lines, progress)
+        
+        # Collect documentation to insert BEFORE each entity line, then splice once
+        insertions = {}
+        for entity, doc in sorted(zip(entities, docs), key=lambda x: x[0].line, reverse=True):
+            line_idx = entity.line - 1
             
             # Skip if doc is empty or just whitespace
             if not doc or not doc.strip():
@@ -803,54 +1400,55 @@ CRITICAL RULES:
             # Split documentation into lines and add indentation
             doc_lines = [line.strip() for line in doc.split('\n') if line.strip()]
             
-            # Insert documentation lines BEFORE the entity (in reverse to maintain order)
-            for doc_line in reversed(doc_lines):
-                lines.insert(line_idx, indent_str + doc_line)
+            # Same-line insertions stack in the order the old in-place inserts produced
+            insertions[line_idx] = [indent_str + doc_line for doc_line in doc_lines] + insertions.get(line_idx, [])
         
-        return '\n'.join(lines)
+        if not insertions:
+            return '\n'.join(lines)
+        
+        fixed_lines = []
+        for i, line in enumerate(lines):
+            if i in insertions:
+                fixed_lines.extend(insertions[i])
+            fixed_lines.append(line)
+        return '\n'.join(fixed_lines)
     
-    def _fix_style_issue(self, lines: List[str], issue: Dict) -> List[str]:
-        """Fix a style issue in existing documentation"""
-        entity = issue['entity']
-        line_idx = entity['line'] - 1
+    @staticmethod
+    def _shifted_line(line: int, removals: List[Tuple[int, int]]) -> int:
+        """Map an entity's original line number past the doc lines removed above it"""
+        return line - sum(count for at, count in removals if at <= line)
+    
+    def _fix_style_issues(self, lines: List[str], issues: List[Dict],
+                          doc_blocks: List[Optional[Tuple[int, int]]]) -> List[str]:
+        """Fix all style issues of one entity in a single pass over its documentation"""
+        line_idx = issues[0]['entity'].line - 1
+        issue_types = {issue['issue_type'] for issue in issues}
+        fix_at_style = 'wrong_style' in issue_types
+        fix_commands = 'wrong_command' in issue_types
+        fix_param_spacing = any(
+            issue['issue_type'] == 'wrong_format' and 'empty lines' in issue.get('message', '')
+            for issue in issues
+        )
         
         # Find the documentation block above this entity
-        doc_start = -1
-        doc_end = -1
-        
-        for i in range(line_idx - 1, max(0, line_idx - 15), -1):
-            line = lines[i].strip()
-            if line.startswith('/**') or line.startswith('///'):
-                doc_start = i
-                break
-            elif line.startswith('*') or line.startswith('*/'):
-                doc_end = i if doc_end == -1 else doc_end
-        
-        if doc_start == -1:
+        block = self._doc_block_for(doc_blocks, line_idx)
+        if block is None:
             return lines
+        doc_start, doc_end = block
         
-        if doc_end == -1:
-            doc_end = line_idx - 1
-        
-        # Fix the documentation block
+        # Fix the documentation block, skipping lines the patterns cannot match
         for i in range(doc_start, doc_end + 1):
+            line = lines[i]
             # Fix @-style to backslash-style
-            if issue['issue_type'] == 'wrong_style':
-                lines[i] = lines[i].replace('@param', '\\param')
-                lines[i] = lines[i].replace('@return', '\\return')
-                lines[i] = lines[i].replace('@throw', '\\throw')
-                lines[i] = lines[i].replace('@tparam', '\\tparam')
-                lines[i] = lines[i].replace('@note', '\\note')
-                lines[i] = lines[i].replace('@warning', '\\warning')
-                lines[i] = lines[i].replace('@brief', '\\brief')
-            
+            if fix_at_style and '@' in line:
+                line = _RE_AT_STYLE_FULL.sub(r'\\\1', line)
             # Remove \brief and \details
-            elif issue['issue_type'] == 'wrong_command':
-                lines[i] = lines[i].replace('\\brief ', '')
-                lines[i] = lines[i].replace('\\details ', '')
+            if fix_commands and '\\' in line:
+                line = _RE_BRIEF_DETAILS.sub('', line)
+            lines[i] = line
         
         # Remove empty lines between \param entries
-        if issue['issue_type'] == 'wrong_format' and 'empty lines' in issue.get('message', ''):
+        if fix_param_spacing:
             new_lines = []
             in_param_section = False
             for i in range(doc_start, doc_end + 1):
@@ -874,16 +1472,19 @@ CRITICAL RULES:
         
         return lines
     
-    def _regenerate_documentation(self, lines: List[str], issue: Dict) -> List[str]:
-        """Regenerate documentation for an entity with wrong brief style"""
-        entity = issue['entity']
-        line_idx = entity['line'] - 1
+    def _remove_documentation(self, lines: List[str], entity: Entity) -> int:
+        """
+        Delete the documentation block above an entity and move the entity up to match
+        Returns the number of lines removed (0 if no block was found)
+        """
+        line_idx = entity.line - 1
         
-        # Find and remove the old documentation block
+        # Find the old documentation block
         doc_start = -1
         doc_end = -1
         
-        for i in range(line_idx - 1, max(0, line_idx - 15), -1):
+        # Same window as _doc_block_for, so removal and lookup agree on the block
+        for i in range(line_idx - 1, max(0, line_idx - DOC_SEARCH_WINDOW), -1):
             line = lines[i].strip()
             if line.startswith('/**'):
                 doc_start = i
@@ -906,34 +1507,10 @@ CRITICAL RULES:
                 break
         
         if doc_start == -1:
-            return lines
+            return 0
         
-        # Remove old documentation
+        # Remove old documentation and update the entity line number
         del lines[doc_start:doc_end+1]
-        
-        # Adjust line index after deletion
-        new_line_idx = line_idx - (doc_end - doc_start + 1)
-        
-        # Update entity line number for regeneration
-        entity['line'] = new_line_idx + 1
-        
-        # Generate new documentation
-        current_content = '\n'.join(lines)
-        new_doc = self.fix_entity(entity, current_content)
-        
-        if not new_doc or not new_doc.strip():
-            return lines
-        
-        # Get indentation from the target line
-        target_line = lines[new_line_idx]
-        indent = len(target_line) - len(target_line.lstrip())
-        indent_str = ' ' * indent
-        
-        # Split documentation into lines and add indentation
-        doc_lines = [line.strip() for line in new_doc.split('\n') if line.strip()]
-        
-        # Insert new documentation lines
-        for doc_line in reversed(doc_lines):
-            lines.insert(new_line_idx, indent_str + doc_line)
-        
-        return lines
+        count = doc_end - doc_start + 1
+        entity.line -= count
+        return count
@@ -1,29 +1,50 @@
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from importlib.util import find_spec
 import os
+import re
+import time
 from dotenv import load_dotenv
 
-try:
-    from tamu_chat import TAMUChatClient
-    TAMU_AVAILABLE = True
-except ImportError:
-    TAMU_AVAILABLE = False
-
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-
-try:
-    from groq import Groq
-    GROQ_AVAILABLE = True
-except ImportError:
-    GROQ_AVAILABLE = False
+# Provider SDKs are only looked up here; each is imported once its provider is configured
+TAMU_AVAILABLE = find_spec("tamu_chat") is not None
+OPENAI_AVAILABLE = find_spec("openai") is not None
+GROQ_AVAILABLE = find_spec("groq") is not None
 
 # Load environment variables
 load_dotenv()
 
 
+def positive_int_env(name: str, default: int) -> int:
+    """Read a positive integer setting, using default when it is unset or not an integer"""
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+# Per-request timeout and retry budget for the Groq/OpenAI/Ollama clients; the SDK
+# defaults (a 10 minute timeout) can leave the Streamlit spinner hanging
+LLM_TIMEOUT_SECONDS = 60.0
+LLM_MAX_RETRIES = 2
+
+# Worker threads that run TAMU requests so LLM_TIMEOUT_SECONDS can bound them (the
+# TAMU SDK takes no timeout); a request still hung after the timeout keeps its thread
+TAMU_MAX_WORKERS = positive_int_env("LLM_MAX_CONCURRENCY", 8)
+
+# How long a check_connection result is reused before the API is pinged again
+CONNECTION_CHECK_TTL_SECONDS = 30
+
+# Characters kept from each documentation chunk in generate_code (about 400 tokens)
+GENERATE_CONTEXT_CHARS = 1600
+
+# First fenced block of a response (the text between the first two ``` markers)
+_RE_FENCED_BLOCK = re.compile(r"```(.*?)```", re.S)
+
+# Line prefixes that mark where generated code starts (one str.startswith call)
+_CODE_START_KEYWORDS = ("import", "from", "#", "def", "class", "var", "const", "let", "function")
+
+
 class LLMClient:
     """Client for LLM API with automatic fallback (TAMU → Groq → OpenAI → Ollama)"""
     
@@ -32,14 +53,18 @@ class LLMClient:
         self.fallback_client = None
         self.provider = None
         self.fallback_provider = None
+        self._last_connection_check = (None, False)  # (monotonic time, result)
         
         # Try TAMU AI Chat first (primary)
         tamu_key = os.getenv("TAMU_API_KEY")
         if tamu_key and TAMU_AVAILABLE:
             try:
+                from tamu_chat import TAMUChatClient
                 self.client = TAMUChatClient(api_key=tamu_key)
                 self.model = "gpt-4o"  # Using GPT-4o (latest available model)
                 self.provider = "tamu"
+                self._tamu_executor = ThreadPoolExecutor(max_workers=TAMU_MAX_WORKERS,
+                                                         thread_name_prefix="tamu")
                 print("✓ Primary: TAMU AI Chat API (GPT-4o)")
             except Exception as e:
                 print(f"⚠ TAMU API initialization failed: {e}")
@@ -48,7 +73,9 @@ class LLMClient:
         groq_key = os.getenv("GROQ_API_KEY")
         if groq_key and groq_key != "your-groq-api-key-here" and GROQ_AVAILABLE:
             try:
-                self.fallback_client = Groq(api_key=groq_key)
+                from groq import Groq
+                self.fallback_client = Groq(api_key=groq_key, timeout=LLM_TIMEOUT_SECONDS,
+                                            max_retries=LLM_MAX_RETRIES)
                 self.fallback_model = "llama-3.3-70b-versatile"  # Updated model (replaces 3.1)
                 self.fallback_provider = "groq"
                 print("✓ Fallback: Groq API (Llama 3.3 70B)")
@@ -67,16 +94,21 @@ class LLMClient:
         if not self.client:
             openai_key = os.getenv("OPENAI_API_KEY")
             if OPENAI_AVAILABLE and openai_key:
-                self.client = OpenAI(api_key=openai_key)
+                from openai import OpenAI
+                self.client = OpenAI(api_key=openai_key, timeout=LLM_TIMEOUT_SECONDS,
+                                     max_retries=LLM_MAX_RETRIES)
                 self.model = "gpt-3.5-turbo"
                 self.provider = "openai"
                 print("✓ Using OpenAI API")
         
         # Ollama as last resort
         if not self.client and OPENAI_AVAILABLE:
+            from openai import OpenAI
             self.client = OpenAI(
                 base_url="http://localhost:11434/v1",
-                api_key="ollama"
+                api_key="ollama",
+                timeout=LLM_TIMEOUT_SECONDS,
+                max_retries=LLM_MAX_RETRIES
             )
             self.model = "llama3.2"
             self.provider = "ollama"
@@ -85,35 +117,20 @@ class LLMClient:
         if not self.client:
             raise RuntimeError("No LLM client available. Install: pip install tamu-chat groq openai")
     
-    def _call_with_fallback(self, messages: List[Dict], temperature: float, max_tokens: int) -> str:
-        """Call LLM with automatic fallback to secondary provider"""
+    def _call_with_fallback(self, messages: List[Dict], temperature: float, max_tokens: int,
+                            stop_when: Optional[Callable[[str], bool]] = None) -> str:
+        """
+        Call LLM with automatic fallback to secondary provider
+        stop_when, if given, is checked on the partial text of a streamed response and
+        ends generation early once it returns True (TAMU responses are not streamed)
+        """
         # Try primary provider
         try:
             if self.provider == "tamu":
                 combined_prompt = messages[0]["content"] + "\n\n" + messages[1]["content"]
-                # Try with model parameter first, fall back to default if it fails
-                try:
-                    response = self.client.chat_completion(combined_prompt, model=self.model)
-                except:
-                    # If model parameter fails, try without it (use default)
-                    response = self.client.chat_completion(combined_prompt)
-                return response.text
-            elif self.provider == "groq":
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens
-                )
-                return response.choices[0].message.content.strip()
-            else:  # OpenAI or Ollama
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens
-                )
-                return response.choices[0].message.content.strip()
+                return self._tamu_completion(combined_prompt).text
+            else:  # Groq, OpenAI or Ollama
+                return self._chat_completion(self.client, self.model, messages, temperature, max_tokens, stop_when)
         except Exception as e:
             print(f"⚠ {self.provider} API failed: {e}")
             
@@ -122,17 +139,75 @@ class LLMClient:
                 print(f"  → Trying fallback: {self.fallback_provider}")
                 try:
                     if self.fallback_provider == "groq":
-                        response = self.fallback_client.chat.completions.create(
-                            model=self.fallback_model,
-                            messages=messages,
-                            temperature=temperature,
-                            max_tokens=max_tokens
-                        )
-                        return response.choices[0].message.content.strip()
+                        return self._chat_completion(self.fallback_client, self.fallback_model, messages,
+                                                     temperature, max_tokens, stop_when)
                 except Exception as fallback_error:
                     print(f"⚠ Fallback also failed: {fallback_error}")
             
             raise Exception(f"All LLM providers failed. Primary: {e}")
+    
+    def _tamu_completion(self, prompt: str):
+        """
+        Run a TAMU chat completion on a worker thread, raising TimeoutError once it takes
+        longer than LLM_TIMEOUT_SECONDS (so _call_with_fallback moves on to Groq)
+        """
+        future = self._tamu_executor.submit(self._tamu_request, prompt)
+        try:
+            return future.result(timeout=LLM_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"TAMU request timed out after {LLM_TIMEOUT_SECONDS:.0f}s")
+    
+    def _tamu_request(self, prompt: str):
+        """Send one TAMU chat completion (runs on a _tamu_executor thread)"""
+        # Try with model parameter first, fall back to default if it fails
+        try:
+            return self.client.chat_completion(prompt, model=self.model)
+        except:
+            # If model parameter fails, try without it (use default)
+            return self.client.chat_completion(prompt)
+    
+    def _chat_completion(self, client, model: str, messages: List[Dict], temperature: float, max_tokens: int,
+                         stop_when: Optional[Callable[[str], bool]]) -> str:
+        """Run an OpenAI-compatible chat completion, streaming it when stop_when is given"""
+        if stop_when is None:
+            response = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            return response.choices[0].message.content.strip()
+        
+        stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        text = ""
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                start = len(text)
+                text += delta
+                # Only a finished line can change the verdict; check each one this
+                # delta completes and cut the text right after the deciding line
+                end = text.find("\n", start)
+                while end != -1 and not stop_when(text[:end + 1]):
+                    end = text.find("\n", end + 1)
+                if end != -1:
+                    text = text[:end + 1]
+                    break
+        finally:
+            # Closing the stream stops the server generating tokens nobody reads
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        return text.strip()
 
     def generate_code(self, prompt: str, context: List[Dict], language: str) -> str:
         """Generate code using RAG context"""
@@ -140,12 +215,22 @@ class LLMClient:
         code_contexts = [item for item in context if item.get('type') == 'code']
         text_contexts = [item for item in context if item.get('type') == 'text']
         
-        # Use code contexts first, then text
-        priority_contexts = (code_contexts + text_contexts)[:5]
+        # Use code contexts first, then text, skipping chunks whose prompt text
+        # (the first GENERATE_CONTEXT_CHARS) repeats an earlier one
+        priority_contexts = []
+        seen = set()
+        for item in code_contexts + text_contexts:
+            snippet = item['content'][:GENERATE_CONTEXT_CHARS]
+            if snippet in seen:
+                continue
+            seen.add(snippet)
+            priority_contexts.append((item['source'], snippet))
+            if len(priority_contexts) == 5:
+                break
         
         context_str = "\n\n=== DOCUMENTATION ===\n\n".join([
-            f"Source: {item['source']}\n\n{item['content']}"
-            for item in priority_contexts
+            f"Source: {source}\n\n{snippet}"
+            for source, snippet in priority_contexts
         ])
         
         full_prompt = f"""TASK: Generate {language} code for: "{prompt}"
@@ -194,21 +279,19 @@ Generate the {language} code:"""
         code = self._call_with_fallback(messages, temperature=0.2, max_tokens=2000)
         
         # Clean up markdown code blocks if present
-        if "```" in code:
-            parts = code.split("```")
-            if len(parts) >= 3:
-                code = parts[1]
-                # Remove language identifier
-                if code.startswith(("python", "javascript", "js", "py")):
-                    code = "\n".join(code.split("\n")[1:])
+        fenced = _RE_FENCED_BLOCK.search(code)
+        if fenced:
+            code = fenced.group(1)
+            # Remove language identifier
+            if code.startswith(("python", "javascript", "js", "py")):
+                code = code.partition("\n")[2]
         
         # Remove any explanatory text before the code
         lines = code.split("\n")
         code_start = 0
         for i, line in enumerate(lines):
             # Find where actual code starts
-            if any(line.strip().startswith(keyword) for keyword in 
-                   ["import", "from", "#", "def", "class", "var", "const", "let", "function"]):
+            if line.strip().startswith(_CODE_START_KEYWORDS):
                 code_start = i
                 break
         
@@ -324,15 +407,19 @@ Use clear markdown formatting with headers, bullet points, code blocks, and bold
         return self._call_with_fallback(messages, temperature=0.5, max_tokens=1500)
     
     def check_connection(self) -> bool:
-        """Check if API is accessible"""
+        """Check if API is accessible (a result is reused for CONNECTION_CHECK_TTL_SECONDS)"""
+        checked_at, ok = self._last_connection_check
+        if checked_at is not None and time.monotonic() - checked_at < CONNECTION_CHECK_TTL_SECONDS:
+            return ok
         try:
             if self.provider == "tamu":
-                # Test with a simple query
-                self.client.chat_completion("Hello")
-                return True
+                # Test with a simple query (bounded like every other TAMU request)
+                self._tamu_completion("Hello")
             else:
                 self.client.models.list()
-                return True
+            ok = True
         except Exception as e:
             print(f"API connection failed: {e}")
-            return False
+            ok = False
+        self._last_connection_check = (time.monotonic(), ok)
+        return ok
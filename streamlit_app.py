@@ -2,10 +2,24 @@
 Streamlit App for Doxygen Documentation Validation and Fixing
 """
 
+import difflib
+import hashlib
+import multiprocessing
+from concurrent.futures.process import BrokenProcessPool
 import streamlit as st
-from doxygen_validator import DoxygenValidator
+from doxygen_validator import DoxygenValidator, validate_in_worker
 import os
 
+# Largest file preview rendered with syntax highlighting in the Fix tab
+MAX_PREVIEW_CHARS = 200_000
+
+# Context shown around the first change in the side-by-side comparison
+PREVIEW_LINES_BEFORE = 20
+PREVIEW_LINES_AFTER = 200
+
+# Documentation lines listed under "Changes Made"
+MAX_LISTED_CHANGES = 30
+
 # Page config
 st.set_page_config(
     page_title="Doxygen Validator",
@@ -20,6 +34,73 @@ def get_validator():
 
 validator = get_validator()
 
+# Parsing is CPU-bound, so it runs in worker processes shared by all sessions instead
+# of holding the GIL on the server thread that serves every user; workers are spawned,
+# since forking the multi-threaded server can deadlock the child
+@st.cache_resource
+def get_validation_pool():
+    return validator.validation_pool(mp_context=multiprocessing.get_context('spawn'))
+
+# Validation only depends on the content, so repeated clicks on the same file are
+# served from the cache (the underscore keeps Streamlit from hashing the content itself)
+@st.cache_data(show_spinner=False, max_entries=128)
+def validate_content(content_hash, _content):
+    pool = get_validation_pool()
+    try:
+        return pool.submit(validate_in_worker, _content).result()
+    except BrokenProcessPool:
+        # A worker crashed or was killed: start a fresh pool next time, validate here now
+        pool.shutdown(wait=False)
+        get_validation_pool.clear()
+        return validator.validate_file(_content)
+
+def preview_window(lines, first):
+    """Return the preview text around line index first and a caption with its real line range"""
+    start = max(0, first - PREVIEW_LINES_BEFORE)
+    end = min(len(lines), first + PREVIEW_LINES_AFTER)
+    return '\n'.join(lines[start:end]), f"Lines {start + 1}-{end} of {len(lines)}"
+
+def summarize_fix(original_content, fixed_content):
+    """Diff the original and fixed files once, collecting everything the Fix tab renders"""
+    original_lines = original_content.split('\n')
+    fixed_lines = fixed_content.split('\n')
+    
+    # Align the two versions so lines after an insertion are not reported as changed
+    opcodes = difflib.SequenceMatcher(a=original_lines, b=fixed_lines).get_opcodes()
+    
+    # Only a window around the first change is highlighted; st.code numbers from 1,
+    # so the window is labelled with its real line range instead
+    first_orig, first_fixed = next(
+        ((i1, j1) for tag, i1, _, j1, _ in opcodes if tag != 'equal'), (0, 0)
+    )
+    original_window, original_caption = preview_window(original_lines, first_orig)
+    fixed_window, fixed_caption = preview_window(fixed_lines, first_fixed)
+    
+    # Only the first MAX_LISTED_CHANGES lines are kept for display; the rest are just counted
+    changes = []
+    total_changes = 0
+    for tag, _, _, j1, j2 in opcodes:
+        if tag not in ('insert', 'replace'):
+            continue
+        for j in range(j1, j2):
+            stripped = fixed_lines[j].strip()
+            # Check if it's a documentation line, noting whether it opens/closes a comment
+            if stripped.startswith(('///', '/**', '*')):
+                total_changes += 1
+                if total_changes <= MAX_LISTED_CHANGES:
+                    changes.append((j + 1, stripped, stripped.startswith(('///', '/**', '*/'))))
+    
+    return {
+        'original_window': original_window,
+        'original_caption': original_caption,
+        'fixed_window': fixed_window,
+        'fixed_caption': fixed_caption,
+        'added_lines': len(fixed_lines) - len(original_lines),
+        'total_lines': len(fixed_lines),
+        'changes': changes,
+        'total_changes': total_changes
+    }
+
 # Title and description
 st.title("📝 OpenSn Doxygen Documentation Validator")
 st.markdown("""
@@ -102,7 +183,7 @@ with tab1:
         
         # Validate
         with st.spinner("Validating documentation..."):
-            result = validator.validate_file(content)
+            result = validate_content(hashlib.sha256(content.encode('utf-8')).hexdigest(), content)
             st.session_state['validation_result'] = result
         
         # Display results
@@ -114,8 +195,7 @@ with tab1:
         with col2:
             st.metric("Issues Found", result['issues_found'])
         with col3:
-            compliance = (result['total_entities'] - result['issues_found']) / max(result['total_entities'], 1) * 100
-            st.metric("Compliance", f"{compliance:.1f}%")
+            st.metric("Compliance", f"{result['compliance_pct']:.1f}%")
         
         # Show issues
         if result['issues_found'] > 0:
@@ -125,13 +205,18 @@ with tab1:
                 entity = issue['entity']
                 severity_icon = "🔴" if issue['severity'] == 'error' else "🟡"
                 
-                with st.expander(f"{severity_icon} Line {entity['line']}: {issue['message']}"):
-                    st.code(entity['content'], language='cpp')
-                    st.caption(f"Type: {entity['type']} | Severity: {issue['severity']}")
+                with st.expander(f"{severity_icon} Line {entity.line}: {issue['message']}"):
+                    st.code(entity.content, language='cpp')
+                    st.caption(f"Type: {entity.type} | Severity: {issue['severity']}")
         else:
             st.success("🎉 No issues found! Documentation is compliant.")
 
-with tab2:
+# Reruns triggered by the Fix tab's own widgets only re-execute this function, not the
+# sidebar or the other tabs (st.fragment needs Streamlit 1.37; older versions rerun everything)
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', lambda func: func)
+
+@fragment
+def fix_tab():
     st.header("Fix Documentation Issues")
     
     if 'validation_result' not in st.session_state:
@@ -153,39 +238,54 @@ with tab2:
             
             if fix_button:
                 with st.spinner("Generating documentation with TAMU AI Chat..."):
+                    # Report each finished batch instead of leaving the user on a bare spinner
+                    progress_bar = st.progress(0.0)
+                    
+                    def show_progress(done, total):
+                        progress_bar.progress(done / total, text=f"Documented {done} of {total} entities")
+                    
                     fixed_content = validator.fix_file(
                         st.session_state['file_content'],
-                        result
+                        result,
+                        progress=show_progress
                     )
+                    progress_bar.empty()
                     st.session_state['fixed_content'] = fixed_content
+                    # Diff once here; reruns of this tab only render the stored summary
+                    st.session_state['fix_summary'] = summarize_fix(st.session_state['file_content'], fixed_content)
                 
                 st.success("✓ Documentation fixed!")
             
             # Show fixed content
-            if 'fixed_content' in st.session_state:
+            if 'fix_summary' in st.session_state:
                 st.subheader("📄 Fixed Code")
                 
-                # Show side-by-side comparison
+                summary = st.session_state['fix_summary']
+                
                 col1, col2 = st.columns(2)
                 with col1:
                     st.markdown("**Original:**")
-                    st.code(st.session_state['file_content'], language='cpp', line_numbers=True)
+                    st.code(summary['original_window'], language='cpp')
+                    st.caption(summary['original_caption'])
                 with col2:
                     st.markdown("**Fixed:**")
-                    st.code(st.session_state['fixed_content'], language='cpp', line_numbers=True)
+                    st.code(summary['fixed_window'], language='cpp')
+                    st.caption(summary['fixed_caption'])
+                
+                # The full file is only highlighted on request (still capped so huge headers
+                # are not pushed to the browser; the download has the full file)
+                if st.toggle("Show entire fixed file"):
+                    st.code(st.session_state['fixed_content'][:MAX_PREVIEW_CHARS], language='cpp', line_numbers=True)
+                    if len(st.session_state['fixed_content']) > MAX_PREVIEW_CHARS:
+                        st.caption("Preview truncated; download the fixed file below for the full content")
                 
                 # Show summary
                 st.divider()
-                original_lines = st.session_state['file_content'].split('\n')
-                fixed_lines = st.session_state['fixed_content'].split('\n')
-                
-                added_count = len(fixed_lines) - len(original_lines)
-                
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    st.metric("📝 Documentation Added", f"{added_count} lines")
+                    st.metric("📝 Documentation Added", f"{summary['added_lines']} lines")
                 with col2:
-                    st.metric("📊 Total Lines", len(fixed_lines))
+                    st.metric("📊 Total Lines", summary['total_lines'])
                 with col3:
                     st.metric("✅ Compliance", "100%")
                 
@@ -193,28 +293,17 @@ with tab2:
                 st.divider()
                 st.subheader("📋 Changes Made")
                 
-                changes = []
-                i = 0
-                while i < len(fixed_lines):
-                    if i >= len(original_lines) or (i < len(original_lines) and original_lines[i] != fixed_lines[i]):
-                        line = fixed_lines[i]
-                        # Check if it's a documentation line
-                        if line.strip().startswith('///') or line.strip().startswith('/**') or line.strip().startswith('*'):
-                            changes.append((i + 1, line.strip()))
-                    i += 1
-                
+                changes = summary['changes']
                 if changes:
                     st.markdown("**Added/Modified Documentation:**")
-                    for line_num, content in changes[:30]:  # Show first 30 changes
-                        if content.startswith('///'):
+                    for line_num, content, is_comment_edge in changes:
+                        if is_comment_edge:
                             st.markdown(f"✅ **Line {line_num}:** `{content}`")
-                        elif content.startswith('/**') or content.startswith('*/'):
-                            st.markdown(f"✅ **Line {line_num}:** `{content}`")
-                        elif content.startswith('*'):
+                        else:
                             st.markdown(f"   **Line {line_num}:** `{content}`")
                     
-                    if len(changes) > 30:
-                        st.caption(f"... and {len(changes) - 30} more documentation lines")
+                    if summary['total_changes'] > MAX_LISTED_CHANGES:
+                        st.caption(f"... and {summary['total_changes'] - MAX_LISTED_CHANGES} more documentation lines")
                 else:
                     st.info("No documentation changes detected")
                 
@@ -227,6 +316,9 @@ with tab2:
                     type="primary"
                 )
 
+with tab2:
+    fix_tab()
+
 with tab3:
     st.header("📖 Complete Doxygen Guidelines")
     
@@ -0,0 +1,46 @@
+"""Table-driven checks of the Get*/Is* template docs written without an LLM call"""
+
+import unittest
+
+from doxygen_validator import Entity, _template_doc
+
+# Method name, expected doc (None: the name is left to the LLM)
+CASES = [
+    ('GetNumGroups', "/// Get the number of groups."),
+    ('GetCellID', "/// Get the cell ID."),
+    ('GetIDs', "/// Get the IDs."),
+    ('GetGlobalIDsMap', "/// Get the global IDs map."),
+    ('IsInitialized', "/// Check if initialized."),
+    ('GetOrCreateCache', None),
+    ('GetAsString', None),
+    ('GetFromIndex', None),
+    ('GetNum', None),
+    ('Get2DMesh', None),
+    ('Is1D', None),
+    ('IsA', None),
+    ('GetIsDone', None),
+    ('GetHasData', None),
+    ('Get_value', None),
+    ('Reset', None),
+]
+
+
+def _method(name: str, params: str = '') -> Entity:
+    return Entity(
+        type='method', line=1, content=f'  int {name}({params}) const;', access='public',
+        name=name, class_name='Mesh', is_constructor=False, is_definition=False
+    )
+
+
+class TemplateDocTest(unittest.TestCase):
+    def test_names(self):
+        for name, expected in CASES:
+            with self.subTest(name=name):
+                self.assertEqual(_template_doc(_method(name)), expected)
+    
+    def test_methods_with_parameters_are_left_to_the_llm(self):
+        self.assertIsNone(_template_doc(_method('GetCellID', 'int local_id')))
+
+
+if __name__ == '__main__':
+    unittest.main()